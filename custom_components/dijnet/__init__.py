@@ -53,25 +53,51 @@ async def async_setup_entry(hass: HomeAssistantType, config_entry: ConfigEntry)
         The value indicates whether the setup succeeded.
     '''
 
-    if not is_controller_exists(hass, config_entry.data[CONF_USERNAME]):
-        set_controller(
-            hass,
-            config_entry.data[CONF_USERNAME],
-            DijnetController(
-                config_entry.data[CONF_USERNAME],
-                config_entry.data[CONF_PASSWORD],
-                config_entry.data[CONF_DOWNLOAD_DIR],
-                config_entry.data[CONF_ENCASHMENT_REPORTED_AS_PAID_AFTER_DEADLINE]
-            )
+    data = config_entry.data
+    username = data[CONF_USERNAME]
+
+    if not is_controller_exists(hass, username):
+        controller = DijnetController(
+            username,
+            data[CONF_PASSWORD],
+            data[CONF_DOWNLOAD_DIR],
+            data[CONF_ENCASHMENT_REPORTED_AS_PAID_AFTER_DEADLINE]
         )
+        set_controller(hass, username, controller)
+        controller.start_issuers_update(hass)
 
-    hass.async_create_task(
-        hass.config_entries.async_forward_entry_setup(config_entry, 'sensor')
-    )
+    await hass.config_entries.async_forward_entry_setups(config_entry, ['sensor'])
 
     return True
 
 
+async def async_unload_entry(hass: HomeAssistantType, config_entry: ConfigEntry) -> bool:
+    '''
+    Unloads the config entry and closes the shared Dijnet session.
+
+    Parameters
+    ----------
+    hass: homeassistant.helpers.typing.HomeAssistantType
+        The Home Assistant instance.
+    config_entry: homeassistant.config_entries.ConfigEntry
+        The config entry to unload.
+
+    Returns
+    -------
+    bool
+        The value indicates whether the unload succeeded.
+    '''
+    unload_ok = await hass.config_entries.async_unload_platforms(config_entry, ['sensor'])
+
+    if unload_ok:
+        username = config_entry.data[CONF_USERNAME]
+        controller = hass.data[DOMAIN][DATA_CONTROLLER].pop(username, None)
+        if controller is not None:
+            await controller.close()
+
+    return unload_ok
+
+
 async def async_migrate_entry(hass: HomeAssistantType, config_entry: ConfigEntry):
     """Migrate old entry."""
     _LOGGER.debug("Migrating from version %s", config_entry.version)
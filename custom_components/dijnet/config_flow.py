@@ -17,6 +17,13 @@ from .dijnet_session import DijnetSession
 
 _LOGGER = logging.getLogger(__name__)
 
+USER_DATA_SCHEMA = vol.Schema({
+    vol.Required(CONF_USERNAME): str,
+    vol.Required(CONF_PASSWORD): str,
+    vol.Optional(CONF_DOWNLOAD_DIR): str,
+    vol.Required(CONF_ENCASHMENT_REPORTED_AS_PAID_AFTER_DEADLINE): bool
+})
+
 
 class DijnetOptionsFlowHandler(OptionsFlow):
     '''Handle Dijnet options.'''
@@ -35,6 +42,20 @@ class DijnetOptionsFlowHandler(OptionsFlow):
         None
         '''
         self.config_entry = config_entry
+        self._data_schema = vol.Schema({
+            vol.Required(
+                CONF_PASSWORD,
+                default=config_entry.data[CONF_PASSWORD]
+            ): str,
+            vol.Optional(
+                CONF_DOWNLOAD_DIR,
+                default=config_entry.data.get(CONF_DOWNLOAD_DIR)
+            ): str,
+            vol.Required(
+                CONF_ENCASHMENT_REPORTED_AS_PAID_AFTER_DEADLINE,
+                default=config_entry.data[CONF_ENCASHMENT_REPORTED_AS_PAID_AFTER_DEADLINE]
+            ): bool
+        })
 
     async def async_step_init(
         self, user_input: Dict[str, Any] = None
@@ -48,21 +69,6 @@ class DijnetOptionsFlowHandler(OptionsFlow):
             The dictionary contains the settings entered by the user
             on the configuration screen.
         '''
-        data_schema = vol.Schema({
-            vol.Required(
-                CONF_PASSWORD,
-                default=self.config_entry.data[CONF_PASSWORD]
-            ): str,
-            vol.Optional(
-                CONF_DOWNLOAD_DIR,
-                default=self.config_entry.data.get(CONF_DOWNLOAD_DIR)
-            ): str,
-            vol.Required(
-                CONF_ENCASHMENT_REPORTED_AS_PAID_AFTER_DEADLINE,
-                default=self.config_entry.data[CONF_ENCASHMENT_REPORTED_AS_PAID_AFTER_DEADLINE]
-            ): bool
-        })
-
         if user_input is not None:
             async with DijnetSession() as session:
                 if not await session.post_login(
@@ -71,7 +77,7 @@ class DijnetOptionsFlowHandler(OptionsFlow):
                 ):
                     return self.async_show_form(
                         step_id='init',
-                        data_schema=data_schema,
+                        data_schema=self._data_schema,
                         errors={'base': 'invalid_username_or_password'}
                     )
 
@@ -81,7 +87,7 @@ class DijnetOptionsFlowHandler(OptionsFlow):
 
             return self.async_abort(reason="reconfigure_successful")
 
-        return self.async_show_form(step_id='init', data_schema=data_schema)
+        return self.async_show_form(step_id='init', data_schema=self._data_schema)
 
 
 @HANDLERS.register(DOMAIN)
@@ -113,13 +119,6 @@ class DijnetConfigFlow(ConfigFlow, domain=DOMAIN):
         '''
         Handles the step when integration added from the UI.
         '''
-        data_schema = vol.Schema({
-            vol.Required(CONF_USERNAME): str,
-            vol.Required(CONF_PASSWORD): str,
-            vol.Optional(CONF_DOWNLOAD_DIR): str,
-            vol.Required(CONF_ENCASHMENT_REPORTED_AS_PAID_AFTER_DEADLINE): bool
-        })
-
         if user_input is not None:
             async with DijnetSession() as session:
                 if not await session.post_login(
@@ -128,7 +127,7 @@ class DijnetConfigFlow(ConfigFlow, domain=DOMAIN):
                 ):
                     return self.async_show_form(
                         step_id='user',
-                        data_schema=data_schema,
+                        data_schema=USER_DATA_SCHEMA,
                         errors={CONF_USERNAME: 'invalid_username_or_password'}
                     )
 
@@ -150,7 +149,7 @@ class DijnetConfigFlow(ConfigFlow, domain=DOMAIN):
 
         return self.async_show_form(
             step_id='user',
-            data_schema=data_schema,
+            data_schema=USER_DATA_SCHEMA,
         )
 
     async def async_step_import(self, import_config: Dict[str, Any]) -> FlowResult:
@@ -2,18 +2,30 @@
 '''
 Module for Dijnet controller.
 '''
+import asyncio
 import json
 import logging
 import re
+import sys
 from datetime import datetime, timedelta, date
-from os import makedirs, path, remove
-from typing import Any, Dict, List, Optional
+from os import fsync, listdir, makedirs, path, replace
+from pathlib import Path
+from collections import defaultdict
+from functools import lru_cache, partial
+from time import monotonic
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 import yaml
+
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
 from homeassistant.helpers.typing import HomeAssistantType
-from homeassistant.util import Throttle, slugify
-from pyquery import PyQuery as pq
-from pyquery.pyquery import PyQuery
+from homeassistant.util import slugify
+from lxml import html as lxml_html
+from lxml.etree import Element, XPath
 
 from .const import DATA_CONTROLLER, DOMAIN
 from .dijnet_session import DijnetSession
@@ -24,10 +36,89 @@ MIN_DATE = "1990-01-01"
 DATE_FORMAT = "%Y.%m.%d"
 MIN_TIME_BETWEEN_UPDATES = timedelta(hours=3)
 MIN_TIME_BETWEEN_ISSUER_UPDATES = timedelta(days=1)
-PAID_INVOICES_FILENAME = ".dijnet_paid_invoices_{0}.yaml"
+MAX_PARALLEL_DOWNLOADS = 4
+PAID_INVOICES_FILENAME = ".dijnet_paid_invoices_{0}.jsonl"
+LEGACY_PAID_INVOICES_FILENAME = ".dijnet_paid_invoices_{0}.yaml"
 REGISTRY_FILENAME = ".dijnet_registry_{0}.yaml"
 ATTR_REGISTRY_NEXT_QUERY_DATE = "next_query_date"
 
+# deletes every character that can occur in the scraped amount column
+# besides digits and the minus sign (spacing, grouping and currency marks)
+AMOUNT_IGNORED_CHARACTERS = dict.fromkeys(map(ord, ' \xa0\u202f.,FtHU'), None)
+NON_AMOUNT_CHARACTERS_REGEX = re.compile(r'[^0-9-]+')
+ROPTS_REGEX = re.compile(rb'var ropts = (.*);')
+# the download page is only mined for a handful of szamla_pdf/szamla_xml
+# hrefs; a byte-level regex avoids building a DOM per invoice
+DOWNLOAD_HREF_REGEX = re.compile(rb'href="([^"]*szamla_(?:pdf|xml)[^"]*)"')
+
+# pages are parsed from the raw response bytes; lxml decodes them in C.
+# comments and processing instructions are never queried, so the parser
+# skips building nodes for them; no_network blocks external fetches
+HTML_PARSER = lxml_html.HTMLParser(
+    encoding='iso-8859-2',
+    remove_comments=True,
+    remove_pis=True,
+    no_network=True
+)
+
+# compiled once at import; .xpath() would re-translate the expression
+# on every call
+TABLE_ROWS_XPATH = XPath(
+    '//table[contains(concat(" ", normalize-space(@class), " "), " table ")]/tbody/tr'
+)
+HISTORY_ROWS_XPATH = XPath(
+    '//table[contains(concat(" ", normalize-space(@class), " "), " table ")]//tr'
+)
+VFW_TOKEN_XPATH = XPath(
+    '//form[@action="szamla_search_submit"]//input[@name="vfw_token"]/@value'
+)
+
+# ordered (fragment, is paid) pairs; 'Tovább a fizetéshez' must precede
+# 'Rendezett' because the paid fragment can occur in the payment link text
+STATE_FRAGMENT_RESULTS = (
+    ('Tovább a fizetéshez', False),
+    ('Rendezett', True),
+    ('Fizetve', True),
+    ('Rendezetlen', False),
+    ('Mobiltelefonra küldve', False),
+    ('Internetbanknak átadva', False),
+)
+ENCASHMENT_STATE_FRAGMENTS = ('Csoportos beszedés', 'Beszedés alatt')
+
+
+def get_element_text(element: Element) -> str:
+    '''
+    Gets the whitespace-normalized text content of an HTML element.
+    '''
+    return ' '.join(element.text_content().split())
+
+
+def parse_amount(text: str) -> int:
+    '''
+    Parses the scraped amount column to an integer forint value.
+
+    The translate fast path covers the characters Dijnet is known to
+    emit; anything unexpected falls back to stripping every character
+    besides digits and the minus sign.
+    '''
+    try:
+        return int(text.translate(AMOUNT_IGNORED_CHARACTERS))
+    except ValueError:
+        return int(NON_AMOUNT_CHARACTERS_REGEX.sub('', text))
+
+
+@lru_cache(maxsize=4096)
+def parse_dijnet_date(text: str) -> str:
+    '''
+    Parses a date in Dijnet format to an ISO date string.
+
+    The parse result is memoized: the same few date strings occur
+    repeatedly across invoice rows and update cycles, and strptime is
+    expensive enough to be worth caching.
+    '''
+    return datetime.strptime(text, DATE_FORMAT).date().isoformat()
+
+
 ATTR_PROVIDER = "provider"
 ATTR_DISPLAY_NAME = "display_name"
 ATTR_INVOICE_NO = "invoice_no"
@@ -43,6 +134,8 @@ class InvoiceIssuer():
     Represents an invoice issuer.
     '''
 
+    __slots__ = ('_issuer_id', '_issuer_name', '_display_name', '_providers')
+
     def __init__(self, issuer_id: str, issuer_name: str, display_name: str, providers: List[str]):
         '''
         Initialize a new instance of InvoiceIssuer class.
@@ -103,6 +196,15 @@ class Invoice:
     Represents an invoice.
     '''
 
+    __slots__ = (
+        '_provider',
+        '_display_name',
+        '_invoice_no',
+        '_issuance_date',
+        '_amount',
+        '_deadline'
+    )
+
     def __init__(
         self,
         provider: str,
@@ -184,6 +286,9 @@ class Invoice:
             obj.provider == self.provider and \
             obj.invoice_no == self.invoice_no
 
+    def __hash__(self):
+        return hash((self._provider, self._invoice_no))
+
     def to_dictionary(self) -> Dict[str, Any]:
         '''
         Converts the paid invoice to a dictionary.
@@ -211,6 +316,8 @@ class PaidInvoice(Invoice):
     Represents a paid invoice.
     '''
 
+    __slots__ = ('_paid_at',)
+
     def __init__(
         self,
         provider: str,
@@ -270,11 +377,9 @@ class PaidInvoice(Invoice):
             dictionary[ATTR_PROVIDER],
             dictionary[ATTR_DISPLAY_NAME],
             dictionary[ATTR_INVOICE_NO],
-            dictionary[ATTR_ISSUANCE_DATE].date().isoformat() if isinstance(
-                dictionary[ATTR_ISSUANCE_DATE], datetime) else dictionary[ATTR_ISSUANCE_DATE],
-            dictionary[ATTR_DEADLINE].date().isoformat() if isinstance(
-                dictionary[ATTR_DEADLINE], datetime) else dictionary[ATTR_DEADLINE],
+            dictionary[ATTR_ISSUANCE_DATE],
             dictionary[ATTR_AMOUNT],
+            dictionary[ATTR_DEADLINE],
             dictionary[ATTR_PAID_AT]
         )
 
@@ -298,6 +403,8 @@ class DijnetController:
     Responsible for providing data from Dijnet website.
     '''
 
+    _old_files_removed = False
+
     def __init__(
         self,
         username: str,
@@ -322,6 +429,11 @@ class DijnetController:
             should be reported as paid after deadline
         '''
         self._username = username
+        self._username_slug = slugify(username)
+        self._paid_invoices_filename = PAID_INVOICES_FILENAME.format(self._username_slug)
+        self._legacy_paid_invoices_filename = \
+            LEGACY_PAID_INVOICES_FILENAME.format(self._username_slug)
+        self._registry_filename = REGISTRY_FILENAME.format(self._username_slug)
         self._password = password
         self._download_dir = download_dir
         self._encashment_reported_as_paid_after_deadline = \
@@ -329,26 +441,64 @@ class DijnetController:
         self._registry: Dict[str, str] = None
         self._unpaid_invoices: List[Invoice] = []
         self._paid_invoices: List[Invoice] = []
+        self._unpaid_invoices_by_key: Dict[Tuple[str, str], List[Invoice]] = {}
+        self._paid_invoice_keys: Set[Tuple[str, str]] = set()
+        self._downloaded_invoice_keys: Set[Tuple[str, str]] = set()
         self._issuers: List[InvoiceIssuer] = []
+        self._issuers_task: Optional[asyncio.Task] = None
+        self._issuers_lock = asyncio.Lock()
+        self._issuers_updated_at: Optional[float] = None
+        self._invoices_lock = asyncio.Lock()
+        self._invoices_updated_at: Optional[float] = None
+        self._session: Optional[DijnetSession] = None
+        # the issuer and invoice scrapes navigate the same stateful
+        # ekonto session, so they must never interleave
+        self._session_lock = asyncio.Lock()
         self._remove_old_files()
 
     def _remove_old_files(self):
-        """ 
+        """
         Removes the old registry and paid invoices files,
         because they could be corrupted if multiple accounts handled.
         """
-        # remove old registry and paid invoice files (they might be corrupted)
-        if path.exists('.dijnet_paid_invoices.yaml'):
-            try:
-                remove('.dijnet_paid_invoices.yaml')
-            except(Exception):
-                _LOGGER.warning('Failed to remove .dijnet_paid_invoices.yaml file')
+        # remove old registry and paid invoice files (they might be corrupted);
+        # once per process is enough, the files never reappear
+        if DijnetController._old_files_removed:
+            return
+
+        DijnetController._old_files_removed = True
 
-        if path.exists('.dijnet_registry.yaml'):
+        for old_filename in ('.dijnet_paid_invoices.yaml', '.dijnet_registry.yaml'):
             try:
-                remove('.dijnet_registry.yaml')
+                Path(old_filename).unlink(missing_ok=True)
             except(Exception):
-                _LOGGER.warning('Failed to remove .dijnet_registry.yaml file')    
+                _LOGGER.warning('Failed to remove %s file', old_filename)
+
+    async def _get_session(self) -> DijnetSession:
+        '''
+        Gets the Dijnet session shared by the update flows.
+
+        The underlying HTTP session — and with it the TCP/TLS connection
+        pool — is created once per controller and reused across updates.
+        The ekonto login itself is short-lived, so every update still
+        posts the credentials on the shared connection.
+
+        Returns
+        -------
+        DijnetSession
+            The shared Dijnet session.
+        '''
+        if self._session is None:
+            self._session = DijnetSession()
+        await self._session.open()
+        return self._session
+
+    async def close(self) -> None:
+        '''
+        Closes the shared Dijnet session.
+        '''
+        if self._session is not None:
+            await self._session.close()
 
     async def get_unpaid_invoices(self) -> List[Invoice]:
         '''
@@ -374,6 +524,53 @@ class DijnetController:
         await self.update_invoices()
         return self._paid_invoices
 
+    async def get_grouped_unpaid_invoices(self) -> Dict[Tuple[str, str], List[Invoice]]:
+        '''
+        Gets the unpaid invoices grouped by (display name, provider) key.
+
+        Returns
+        -------
+        Dict[Tuple[str, str], List[Invoice]]
+            The unpaid invoices grouped by (display name, provider) key.
+        '''
+        await self.update_invoices()
+        return self._unpaid_invoices_by_key
+
+    @staticmethod
+    def _group_invoices(invoices: List[Invoice]) -> Dict[Tuple[str, str], List[Invoice]]:
+        '''
+        Groups the specified invoices by (display name, provider) key.
+
+        Parameters
+        ----------
+        invoices: List[Invoice]
+            The invoices to group.
+
+        Returns
+        -------
+        Dict[Tuple[str, str], List[Invoice]]
+            The invoices grouped by (display name, provider) key.
+        '''
+        grouped: Dict[Tuple[str, str], List[Invoice]] = defaultdict(list)
+        for invoice in invoices:
+            grouped[(invoice.display_name, invoice.provider)].append(invoice)
+        return dict(grouped)
+
+    def start_issuers_update(self, hass: HomeAssistantType) -> None:
+        '''
+        Starts updating the registered issuers list as a background task.
+
+        The task is started during config entry setup so the network
+        round-trip runs concurrently with platform forwarding. Platforms
+        awaiting `get_issuers` share the result of this single task.
+
+        Parameters
+        ----------
+        hass: homeassistant.helpers.typing.HomeAssistantType
+            The Home Assistant instance.
+        '''
+        self._issuers_task = hass.async_create_task(self.update_registered_issuers())
+
     async def get_issuers(self) -> List[InvoiceIssuer]:
         '''
         Gets the list of registered invoice issuers.
@@ -383,202 +580,263 @@ class DijnetController:
         List[InvoiceIssuer]
             The list of registered invoice issuers.
         '''
-        await self.update_registered_issuers()
+        if self._issuers_task is not None and not self._issuers_task.done():
+            await self._issuers_task
+        else:
+            await self.update_registered_issuers()
         return self._issuers
 
-    @Throttle(MIN_TIME_BETWEEN_ISSUER_UPDATES)
     async def update_registered_issuers(self):
         '''
         Updates the registered issuers list.
+
+        Concurrent callers are serialized by a lock and while the previous
+        successful update is fresher than MIN_TIME_BETWEEN_ISSUER_UPDATES
+        the cached list is returned without a new request.
         '''
-        issuers: List[InvoiceIssuer] = []
+        async with self._issuers_lock:
+            if self._issuers_updated_at is not None and \
+                    (monotonic() - self._issuers_updated_at) < \
+                    MIN_TIME_BETWEEN_ISSUER_UPDATES.total_seconds():
+                return
 
-        _LOGGER.debug('Updating issuers.')
+            issuers: List[InvoiceIssuer] = []
 
-        async with DijnetSession() as session:
-            await session.get_root_page()
+            _LOGGER.debug('Updating issuers.')
 
-            if not await session.post_login(self._username, self._password):
-                return
+            async with self._session_lock:
+                session = await self._get_session()
 
-            await session.get_main_page()
+                await session.get_root_page()
 
-            search_page = await session.get_invoice_search_page()
+                if not await session.post_login(self._username, self._password):
+                    return
+
+                await session.get_main_page()
+
+                search_page = await session.get_invoice_search_page()
 
-            providers_json = re.search(
-                r'var ropts = (.*);', search_page.decode("iso-8859-2")
-            ).groups(1)[0]
+                # match on the raw bytes and decode only the JSON blob
+                # instead of decoding the whole search page
+                providers_json = ROPTS_REGEX.search(search_page).group(1)
 
-            raw_providers: List[Any] = json.loads(providers_json)
+                raw_providers: List[Any] = json.loads(providers_json.decode("iso-8859-2"))
+
+                providers_by_alias: Dict[str, List[str]] = defaultdict(list)
+                for raw_provider in raw_providers:
+                    providers_by_alias[raw_provider['alias'] or raw_provider['aliasnev']].append(
+                        sys.intern(raw_provider['szlaszolgnev'])
+                    )
 
-            await session.get_new_providers_page()
+                await session.get_new_providers_page()
 
-            invoice_providers_response = await session.get_registered_providers_page()
+                invoice_providers_response = await session.get_registered_providers_page()
 
-            invoice_providers_response_pquery = pq(invoice_providers_response.decode("iso-8859-2").encode('utf-8'))
-            for row in invoice_providers_response_pquery.find(".table > tbody > tr").items():
-                issuer_name = row.children("td:nth-child(1)").text()
-                issuer_id = row.children("td:nth-child(2)").text()
-                display_name = row.children("td:nth-child(3)").text() or issuer_id
-                providers = [
-                    raw_provider['szlaszolgnev'] for
-                    raw_provider in
-                    raw_providers if
-                    (raw_provider['alias'] or raw_provider['aliasnev']) == display_name
-                ]
-                issuer = InvoiceIssuer(issuer_id, issuer_name, display_name, providers)
-                issuers.append(issuer)
-                _LOGGER.debug("Issuer found (%s)", issuer)
+                invoice_providers_root = lxml_html.fromstring(
+                    invoice_providers_response, parser=HTML_PARSER
+                )
+                for row in TABLE_ROWS_XPATH(invoice_providers_root):
+                    cells = row.findall('td')
+                    issuer_name = get_element_text(cells[0])
+                    issuer_id = get_element_text(cells[1])
+                    display_name = sys.intern(get_element_text(cells[2]) or issuer_id)
+                    providers = providers_by_alias.get(display_name, [])
+                    issuer = InvoiceIssuer(issuer_id, issuer_name, display_name, providers)
+                    issuers.append(issuer)
+                    _LOGGER.debug("Issuer found (%s)", issuer)
 
-            self._issuers = issuers
+                self._issuers = issuers
+                self._issuers_updated_at = monotonic()
 
-    @Throttle(MIN_TIME_BETWEEN_UPDATES)
     async def update_invoices(self):
         '''
         Updates the invoice lists.
+
+        Concurrent callers are serialized by a lock and while the previous
+        successful update is fresher than MIN_TIME_BETWEEN_UPDATES the
+        cached lists are kept without a new request.
         '''
+        async with self._invoices_lock:
+            if self._invoices_updated_at is not None and \
+                    (monotonic() - self._invoices_updated_at) < \
+                    MIN_TIME_BETWEEN_UPDATES.total_seconds():
+                return
+
+            await self._do_update_invoices()
+
+    async def _do_update_invoices(self):
         _LOGGER.debug("Updating invoices.")
 
         if self._registry is None:
             self._initialize_registry_and_unpaid_invoices()
 
-        async with DijnetSession() as session:
+        async with self._session_lock:
+            session = await self._get_session()
+
             await session.get_root_page()
 
             if not await session.post_login(self._username, self._password):
                 return
 
+            today = datetime.now().date()
             from_date = self._registry[ATTR_REGISTRY_NEXT_QUERY_DATE]
-            to_date = datetime.now().date().isoformat()
+            to_date = today.isoformat()
 
             await session.get_main_page()
 
             search_page = await session.get_invoice_search_page()
-            search_page_pyquery = pq(search_page.decode("iso-8859-2").encode('utf-8'))            
-            
-            vfw_token = next(search_page_pyquery.find('form[action=szamla_search_submit] input[name=vfw_token]').items()).val()
+            search_page_root = lxml_html.fromstring(search_page, parser=HTML_PARSER)
+
+            vfw_token = VFW_TOKEN_XPATH(search_page_root)[0]
 
             search_result = await session.post_search_invoice('', '', vfw_token, from_date, to_date)
 
-            invoices_pyquery = pq(search_result.decode("iso-8859-2").encode('utf-8'))
-            possible_new_paid_invoices: List[PaidInvoice] = []
+            invoices_root = lxml_html.fromstring(search_result, parser=HTML_PARSER)
             possible_new_unpaid_invoices: List[Invoice] = []
-            index = 0
-            for row in invoices_pyquery.find('.table > tbody > tr').items():
-                invoice: Invoice = None
-                is_paid: Optional[bool] = self._is_invoice_paid(row)
-                if is_paid is None:
-                    _LOGGER.error('Failed to determine invoice state. State column text: %s',
-                                  row.children('td:nth-child(8)').text())
-                    continue
-                elif self._is_invoice_paid(row):
-                    await session.get_invoice_page(index)
-                    invoice_history_page = await session.get_invoice_history_page()
-                    invoice_history_page_response_pyquery = pq(invoice_history_page.decode("iso-8859-2").encode('utf-8'))
-                    for history_row in invoice_history_page_response_pyquery.find('.table tr').items():
-                        if history_row.children('td:nth-child(4)').text() == '**Sikeres fizetés**':
-                            paid_at = datetime.strptime(
-                                history_row.children('td:nth-child(1)').text(),
-                                DATE_FORMAT
-                            ).date().isoformat()
-                            invoice = self._create_invoice_from_row(row, paid_at)
-                            possible_new_paid_invoices.append(invoice)
-                        else:
-                            # payment info not found, but invoice paid
-                            paid_at = datetime.strptime(row.children(
-                                'td:nth-child(6)').text(), DATE_FORMAT
-                            ).replace(tzinfo=None).date().isoformat()
-                            invoice = self._create_invoice_from_row(row, paid_at)
-                            possible_new_paid_invoices.append(invoice)
-
-                    if invoice is None:
-                        _LOGGER.warning(
-                            'History table rows not found. Setting paid_at value to deadline'
-                        )
-                        _LOGGER.debug(invoice_history_page.decode("iso-8859-2"))
-                        paid_at = datetime.strptime(row.children(
-                            'td:nth-child(6)').text(), DATE_FORMAT
-                        ).replace(tzinfo=None).date().isoformat()
-                        invoice = self._create_invoice_from_row(row, paid_at)
-                else:
-                    invoice = self._create_invoice_from_row(row)
-                    possible_new_unpaid_invoices.append(invoice)
-
-                if self._download_dir != '':
-                    directory = path.join(self._download_dir, slugify(invoice.provider))
-                    makedirs(directory, exist_ok=True)
-                    if invoice is not PaidInvoice:
-                        await session.get_invoice_page(index)
-
-                    invoice_download_page = await session.get_invoice_download_page()
-
-                    unpaid_invoice_download_page_response_pyquery = PyQuery(
-                        invoice_download_page)
-
-                    for downloadable_link in unpaid_invoice_download_page_response_pyquery.find('#content_bs a[href*=szamla_pdf], a[href*=szamla_xml]').items():
-                        href = downloadable_link.attr('href')
-                        extension = href.split('?')[0].split('_')[-1]
-                        name = href.split('?')[0][:-4]
-                        filename = slugify(
-                            f"{datetime.fromisoformat(invoice.issuance_date).strftime('%Y%m%d')}_{invoice.invoice_no}_{name}"
-                        )+f'.{extension}'
-                        download_url = f"https://www.dijnet.hu/ekonto/control/{href}"
-                        _LOGGER.debug('Downloadable file found (%s).', download_url)
-
-                        full_path = path.join(directory, filename)
+            loop = asyncio.get_running_loop()
+            download_semaphore = asyncio.Semaphore(MAX_PARALLEL_DOWNLOADS)
+            existing_files_by_directory: Dict[str, set] = {}
+            directories_by_provider: Dict[str, str] = {}
+            new_paid_invoices: List[PaidInvoice] = []
+            paid_invoices_file = await loop.run_in_executor(
+                None, open, self._paid_invoices_filename, "a"
+            )
 
-                        if path.exists(full_path):
-                            _LOGGER.debug('File already downloaded (%s)', full_path)
-                        else:
-                            _LOGGER.info('Downloading file (%s -> %s).', download_url, full_path)
-                            file_content = await session.download(download_url)
-                            with open(full_path, "wb") as file:
-                                file.write(file_content)
+            def write_paid_invoice_record(record: str) -> None:
+                paid_invoices_file.write(record)
+                paid_invoices_file.flush()
+
+            async def register_paid_invoice(paid_invoice: PaidInvoice) -> None:
+                # persisted immediately so an interrupted update does not
+                # lose the records fetched so far; the write and flush run
+                # in the executor like the other disk work in this flow
+                key = (paid_invoice.provider, paid_invoice.invoice_no)
+                if key in self._paid_invoice_keys:
+                    return
+                self._paid_invoice_keys.add(key)
+                self._paid_invoices.append(paid_invoice)
+                new_paid_invoices.append(paid_invoice)
+                record = json.dumps(paid_invoice.to_dictionary(), default=str) + "\n"
+                await loop.run_in_executor(None, write_paid_invoice_record, record)
 
-                index += 1
-                await session.get_invoice_list_page()
+            try:
+                for index, row in enumerate(TABLE_ROWS_XPATH(invoices_root)):
+                    cells = [get_element_text(cell) for cell in row.findall('td')]
+                    invoice: Invoice = None
+                    is_paid: Optional[bool] = self._is_invoice_paid(cells, today)
+                    if is_paid is None:
+                        _LOGGER.error('Failed to determine invoice state. State column text: %s',
+                                      cells[7] if len(cells) > 7 else '')
+                        continue
+                    elif is_paid:
+                        await session.get_invoice_page(index)
+                        invoice_history_page = await session.get_invoice_history_page()
+                        invoice_history_root = lxml_html.fromstring(
+                            invoice_history_page, parser=HTML_PARSER
+                        )
+                        for history_row in HISTORY_ROWS_XPATH(invoice_history_root):
+                            history_cells = history_row.findall('td')
+                            history_state = \
+                                get_element_text(history_cells[3]) if len(history_cells) > 3 else ''
+                            if 'Sikeres fizetés' in history_state:
+                                paid_at = parse_dijnet_date(get_element_text(history_cells[0]))
+                                invoice = self._create_invoice_from_row(cells, paid_at)
+                                await register_paid_invoice(invoice)
+                            else:
+                                # payment info not found, but invoice paid
+                                paid_at = parse_dijnet_date(cells[5])
+                                invoice = self._create_invoice_from_row(cells, paid_at)
+                                await register_paid_invoice(invoice)
+
+                        if invoice is None:
+                            _LOGGER.warning(
+                                'History table rows not found. Setting paid_at value to deadline'
+                            )
+                            _LOGGER.debug(invoice_history_page.decode("iso-8859-2"))
+                            paid_at = parse_dijnet_date(cells[5])
+                            invoice = self._create_invoice_from_row(cells, paid_at)
+                    else:
+                        invoice = self._create_invoice_from_row(cells)
+                        possible_new_unpaid_invoices.append(invoice)
+
+                    download_key = (invoice.invoice_no, invoice.issuance_date)
+                    if self._download_dir != '' and \
+                            download_key not in self._downloaded_invoice_keys:
+                        directory = directories_by_provider.get(invoice.provider)
+                        if directory is None:
+                            directory = path.join(self._download_dir, slugify(invoice.provider))
+                            directories_by_provider[invoice.provider] = directory
+                        existing_files = existing_files_by_directory.get(directory)
+                        if existing_files is None:
+                            # directory probing touches the disk; keep it off
+                            # the event loop (and cached, one scan per dir)
+                            await loop.run_in_executor(
+                                None, partial(makedirs, directory, exist_ok=True)
+                            )
+                            existing_files = set(
+                                await loop.run_in_executor(None, listdir, directory)
+                            )
+                            existing_files_by_directory[directory] = existing_files
+                        if invoice is not PaidInvoice:
+                            await session.get_invoice_page(index)
+
+                        invoice_download_page = await session.get_invoice_download_page()
+
+                        downloads: List[Tuple[str, str]] = []
+                        issuance_date_prefix = invoice.issuance_date.replace('-', '')
+                        for href_bytes in DOWNLOAD_HREF_REGEX.findall(invoice_download_page):
+                            href = href_bytes.decode('iso-8859-2')
+                            base = href.partition('?')[0]
+                            extension = base.rpartition('_')[2]
+                            name = base[:-4]
+                            filename = slugify(
+                                f"{issuance_date_prefix}_{invoice.invoice_no}_{name}"
+                            )+f'.{extension}'
+                            download_url = f"https://www.dijnet.hu/ekonto/control/{href}"
+                            _LOGGER.debug('Downloadable file found (%s).', download_url)
+
+                            full_path = path.join(directory, filename)
+
+                            if filename in existing_files:
+                                _LOGGER.debug('File already downloaded (%s)', full_path)
+                            else:
+                                existing_files.add(filename)
+                                downloads.append((download_url, full_path))
+
+                        if downloads:
+                            await asyncio.gather(*(
+                                self._download_invoice_file(
+                                    session, download_semaphore, download_url, full_path
+                                )
+                                for download_url, full_path in downloads
+                            ))
+
+                        # every file of this invoice is on disk now; later
+                        # refreshes can skip its select/download round-trips
+                        self._downloaded_invoice_keys.add(download_key)
+
+                    await session.get_invoice_list_page()
+            finally:
+                await loop.run_in_executor(None, paid_invoices_file.close)
+
+            unpaid_invoices_by_key = {
+                (invoice.provider, invoice.invoice_no): invoice
+                for invoice in self._unpaid_invoices
+            }
 
-            paid_invoices = self._paid_invoices.copy()
-            unpaid_invoices = self._unpaid_invoices.copy()
-            new_paid_invoices: List[PaidInvoice] = []
-            for possible_new_paid_invoice in possible_new_paid_invoices:
-                already_exists = False
-                for paid_invoice in paid_invoices:
-                    if paid_invoice == possible_new_paid_invoice:
-                        already_exists = True
-                        break
-
-                if not already_exists:
-                    paid_invoices.append(possible_new_paid_invoice)
-                    new_paid_invoices.append(possible_new_paid_invoice)
-                    for unpaid_invoice in unpaid_invoices:
-                        if unpaid_invoice == possible_new_paid_invoice:
-                            unpaid_invoices.remove(unpaid_invoice)
-                            break
+            for new_paid_invoice in new_paid_invoices:
+                unpaid_invoices_by_key.pop(
+                    (new_paid_invoice.provider, new_paid_invoice.invoice_no), None
+                )
 
             for possible_new_unpaid_invoice in possible_new_unpaid_invoices:
-                already_exists = False
-                for unpaid_invoice in unpaid_invoices:
-                    if unpaid_invoice == possible_new_unpaid_invoice:
-                        already_exists = True
-                        break
-
-                if not already_exists:
-                    unpaid_invoices.append(possible_new_unpaid_invoice)
-
-            if len(new_paid_invoices) > 0:
-                with open(get_paid_invoices_filename(self._username), "a") as file:
-                    file.write("\n")
-                    yaml.dump(
-                        list(
-                            map(lambda x: x.to_dictionary(), new_paid_invoices)
-                        ),
-                        file,
-                        default_flow_style=False
-                    )
+                key = (possible_new_unpaid_invoice.provider, possible_new_unpaid_invoice.invoice_no)
+                if key not in unpaid_invoices_by_key:
+                    unpaid_invoices_by_key[key] = possible_new_unpaid_invoice
 
-            next_query_date = (datetime.fromisoformat(to_date) -
-                               timedelta(days=31)).date().isoformat()
+            unpaid_invoices = list(unpaid_invoices_by_key.values())
+
+            next_query_date = (today - timedelta(days=31)).isoformat()
 
             for unpaid_invoice in unpaid_invoices:
                 if next_query_date > unpaid_invoice.issuance_date:
@@ -588,23 +846,72 @@ class DijnetController:
                 ATTR_REGISTRY_NEXT_QUERY_DATE: next_query_date
             }
 
-            with open(get_registry_filename(self._username), "w") as file:
-                yaml.dump(registry, file, default_flow_style=False)
+            await loop.run_in_executor(None, self._write_registry, next_query_date)
 
             self._registry = registry
             self._unpaid_invoices = unpaid_invoices
-            self._paid_invoices = paid_invoices
-
-    def _create_invoice_from_row(self, row: PyQuery, paid_at: datetime = None) -> Invoice:
-        provider = row.children('td:nth-child(1)').text()
-        display_name = row.children('td:nth-child(2)').text()
-        invoice_no = row.children('td:nth-child(3)').text()
-        issuance_date = datetime.strptime(row.children(
-            'td:nth-child(4)').text(), DATE_FORMAT).replace(tzinfo=None).date().isoformat()
-        amount = float(
-            re.sub(r'[^0-9\-]+', '', row.children('td:nth-child(5)').text()))
-        deadline = datetime.strptime(row.children(
-            'td:nth-child(6)').text(), DATE_FORMAT).replace(tzinfo=None).date().isoformat()
+            self._unpaid_invoices_by_key = self._group_invoices(unpaid_invoices)
+            self._invoices_updated_at = monotonic()
+
+    def _write_registry(self, next_query_date: str) -> None:
+        '''
+        Writes the registry file. Runs in the executor.
+
+        Written atomically so a crash mid-write cannot leave a torn
+        registry behind and force a full re-crawl on the next start.
+
+        Parameters
+        ----------
+        next_query_date: str
+            The next query date as date iso string.
+        '''
+        registry_tmp_filename = self._registry_filename + '.tmp'
+        with open(registry_tmp_filename, "w") as file:
+            file.write(next_query_date)
+            file.flush()
+            fsync(file.fileno())
+        replace(registry_tmp_filename, self._registry_filename)
+
+    @staticmethod
+    async def _download_invoice_file(
+        session: DijnetSession,
+        semaphore: asyncio.Semaphore,
+        download_url: str,
+        full_path: str
+    ) -> None:
+        '''
+        Downloads a single invoice file to the specified path.
+
+        Parameters
+        ----------
+        session: DijnetSession
+            The logged in Dijnet session.
+        semaphore: asyncio.Semaphore
+            The semaphore bounding the number of parallel downloads.
+        download_url: str
+            The url of the file to download.
+        full_path: str
+            The target path of the downloaded file.
+        '''
+        async with semaphore:
+            _LOGGER.info('Downloading file (%s -> %s).', download_url, full_path)
+            file_content = await session.download(download_url)
+
+        # written off the event loop; invoice files can be megabytes and
+        # Home Assistant storage is often a slow SD card
+        await asyncio.get_running_loop().run_in_executor(
+            None, Path(full_path).write_bytes, file_content
+        )
+
+    def _create_invoice_from_row(self, cells: List[str], paid_at: datetime = None) -> Invoice:
+        # interned so the repeated (display_name, provider) grouping key
+        # hashes and compares on identical string objects
+        provider = sys.intern(cells[0])
+        display_name = sys.intern(cells[1])
+        invoice_no = cells[2]
+        issuance_date = parse_dijnet_date(cells[3])
+        amount = parse_amount(cells[4])
+        deadline = parse_dijnet_date(cells[5])
 
         invoice: Invoice = None
         if paid_at:
@@ -631,74 +938,95 @@ class DijnetController:
 
         return invoice
 
-    def _is_invoice_paid(self, row: PyQuery) -> Optional[bool]:
-        state_text = row.children('td:nth-child(8)').text()
-
-        go_to_pay: bool = 'Tovább a fizetéshez' in state_text
-        if go_to_pay:
-            return False
-
-        paid: bool = 'Rendezett' in state_text
-        if paid:
-            return True
+    def _is_invoice_paid(self, cells: List[str], today: date) -> Optional[bool]:
+        state_text = cells[7] if len(cells) > 7 else ''
 
-        paid = 'Fizetve' in state_text
-        if paid:
-            return True
+        for fragment, is_paid in STATE_FRAGMENT_RESULTS:
+            if fragment in state_text:
+                return is_paid
 
-        not_paid: bool = 'Rendezetlen' in state_text
-        if not_paid:
-            return False
-
-        sent_to_mobile: bool = 'Mobiltelefonra küldve' in state_text
-        if sent_to_mobile:
-            return False
+        if any(fragment in state_text for fragment in ENCASHMENT_STATE_FRAGMENTS):
+            if self._encashment_reported_as_paid_after_deadline:
+                deadline = date.fromisoformat(parse_dijnet_date(cells[5]))
+                return deadline < today
 
-        sent_to_internet_banking: bool = 'Internetbanknak átadva' in state_text
-        if sent_to_internet_banking:
             return False
 
-        collection: bool = 'Csoportos beszedés' in state_text or 'Beszedés alatt' in state_text
-        if collection:
-            if self._encashment_reported_as_paid_after_deadline:
-                deadline = datetime.strptime(row.children(
-                    'td:nth-child(6)').text(), DATE_FORMAT).replace(tzinfo=None).date()
-                return deadline < datetime.now().date()
-            else:
-                return False
-
         return None
 
     def _initialize_registry_and_unpaid_invoices(self):
         paid_invoices = None
         registry = None
-        paid_invoices_filename = get_paid_invoices_filename(self._username)
-        registry_filename = get_registry_filename(self._username)
+        paid_invoices_filename = self._paid_invoices_filename
+        registry_filename = self._registry_filename
         try:
             _LOGGER.debug('Loading registry from "%s"', registry_filename)
             with open(registry_filename) as file:
-                registry = yaml.safe_load(file)
+                registry_content = file.read().strip()
+
+            if ':' in registry_content:
+                # legacy YAML registry written by earlier versions
+                legacy_registry = yaml.load(registry_content, Loader=_YamlLoader)
+                next_query_date = legacy_registry[ATTR_REGISTRY_NEXT_QUERY_DATE]
+                if isinstance(next_query_date, datetime):
+                    next_query_date = next_query_date.date().isoformat()
+                elif isinstance(next_query_date, date):
+                    next_query_date = next_query_date.isoformat()
+            else:
+                next_query_date = registry_content
 
-            if isinstance(registry[ATTR_REGISTRY_NEXT_QUERY_DATE], datetime):
-                registry[ATTR_REGISTRY_NEXT_QUERY_DATE] = registry[ATTR_REGISTRY_NEXT_QUERY_DATE].date().isoformat()
-            elif isinstance(registry[ATTR_REGISTRY_NEXT_QUERY_DATE], date):
-                registry[ATTR_REGISTRY_NEXT_QUERY_DATE] = registry[ATTR_REGISTRY_NEXT_QUERY_DATE].isoformat()
+            registry = {ATTR_REGISTRY_NEXT_QUERY_DATE: next_query_date}
 
             paid_invoices = []
             _LOGGER.debug('Loading invoices from "%s"', paid_invoices_filename)
-            with open(paid_invoices_filename) as file:
-                data = yaml.safe_load(file)
+            if path.exists(paid_invoices_filename):
+                data = []
+                with open(paid_invoices_filename) as file:
+                    for line in file:
+                        if not line.strip():
+                            continue
+                        try:
+                            data.append(json.loads(line))
+                        except json.JSONDecodeError as exception:
+                            # a torn last line is the expected leftover of an
+                            # interrupted append; skip it instead of failing
+                            # the whole setup
+                            _LOGGER.warning(
+                                'Invalid paid invoice line: %s',
+                                exception
+                            )
+            else:
+                # migrate the previous YAML based store to JSONL
+                with open(self._legacy_paid_invoices_filename) as file:
+                    data = yaml.load(file, Loader=_YamlLoader) or []
+
+                # the YAML store kept dates as date/datetime objects,
+                # the JSONL store keeps them as ISO strings
                 for paid_invoice_dict in data:
-                    try:
-                        paid_invoices.append(
-                            PaidInvoice.from_dictionary(paid_invoice_dict)
-                        )
-                    # pylint: disable=broad-except
-                    except Exception as exception:
-                        _LOGGER.warning(
-                            'Invalid paid invoice data: %s',
-                            exception
-                        )
+                    for attr in (ATTR_ISSUANCE_DATE, ATTR_DEADLINE, ATTR_PAID_AT):
+                        value = paid_invoice_dict.get(attr)
+                        if isinstance(value, datetime):
+                            paid_invoice_dict[attr] = value.date().isoformat()
+                        elif isinstance(value, date):
+                            paid_invoice_dict[attr] = value.isoformat()
+
+            for paid_invoice_dict in data:
+                try:
+                    paid_invoices.append(
+                        PaidInvoice.from_dictionary(paid_invoice_dict)
+                    )
+                # pylint: disable=broad-except
+                except Exception as exception:
+                    _LOGGER.warning(
+                        'Invalid paid invoice data: %s',
+                        exception
+                    )
+
+            if not path.exists(paid_invoices_filename):
+                with open(paid_invoices_filename, "w") as file:
+                    for paid_invoice in paid_invoices:
+                        file.write(json.dumps(paid_invoice.to_dictionary(), default=str))
+                        file.write("\n")
         except FileNotFoundError:
             _LOGGER.debug('"%s" or "%s" not found.', paid_invoices_filename, registry_filename)
             paid_invoices = []
@@ -707,6 +1035,9 @@ class DijnetController:
             }
 
         self._paid_invoices = paid_invoices
+        self._paid_invoice_keys = {
+            (invoice.provider, invoice.invoice_no) for invoice in paid_invoices
+        }
         self._registry = registry
 
 
@@ -764,11 +1095,3 @@ def is_controller_exists(hass: HomeAssistantType, user_name: str) -> bool:
         username in Home Assistant data container.
     '''
     return user_name in hass.data[DOMAIN][DATA_CONTROLLER]
-
-
-def get_paid_invoices_filename(username: str) -> str:
-    return PAID_INVOICES_FILENAME.format(slugify(username))
-
-
-def get_registry_filename(username: str) -> str:
-    return REGISTRY_FILENAME.format(slugify(username))
@@ -13,6 +13,9 @@ _LOGGER = logging.getLogger(__name__)
 
 DATE_FORMAT = "%Y-%m-%d"
 ROOT_URL = 'https://www.dijnet.hu'
+# bounds every request so an unresponsive Dijnet cannot stall a refresh
+# for the aiohttp default of five minutes
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=60, connect=10)
 
 
 class DijnetSession:
@@ -26,8 +29,23 @@ class DijnetSession:
         '''
         self._session = None
 
+    async def open(self) -> None:
+        '''
+        Opens the underlying HTTP session if it is not open yet.
+        '''
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=REQUEST_TIMEOUT)
+
+    async def close(self) -> None:
+        '''
+        Closes the underlying HTTP session.
+        '''
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
     async def __aenter__(self):
-        self._session = aiohttp.ClientSession()
+        await self.open()
         return self
 
     async def __aexit__(
@@ -36,7 +54,7 @@ class DijnetSession:
         exc_val: Optional[BaseException],
         exc_tb: Optional[TracebackType]
     ):
-        await self._session.__aexit__(exc_type, exc_val, exc_tb)
+        await self.close()
 
     async def get_root_page(self) -> bytes:
         '''
@@ -245,7 +263,11 @@ class DijnetSession:
                     "password": password
                 }
         ) as response:
-            json = await response.json(content_type='text/plain')
-            if not json['success']:
-                _LOGGER.warning(json)
-            return json['success']
+            if not response.ok:
+                _LOGGER.warning('Login request failed with status %s.', response.status)
+                return False
+
+            login_result = await response.json(content_type='text/plain')
+            if not login_result['success']:
+                _LOGGER.warning(login_result)
+            return login_result['success']
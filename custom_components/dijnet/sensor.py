@@ -1,5 +1,6 @@
 """Support for Dijnet."""
 import logging
+from typing import Any, Dict, List, Optional, Tuple
 
 import homeassistant.helpers.config_validation as cv
 import voluptuous as vol
@@ -13,9 +14,12 @@ from homeassistant.helpers.entity import DeviceInfo
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.typing import (ConfigType, DiscoveryInfoType,
                                           HomeAssistantType)
+from homeassistant.helpers.update_coordinator import (CoordinatorEntity,
+                                                      DataUpdateCoordinator)
 
 from .const import CONF_DOWNLOAD_DIR, DOMAIN
-from .controller import DijnetController, InvoiceIssuer, get_controller
+from .controller import (MIN_TIME_BETWEEN_UPDATES, Invoice, InvoiceIssuer,
+                         get_controller)
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -75,30 +79,52 @@ async def async_setup_entry(
 
     controller = get_controller(hass, config_entry.data[CONF_USERNAME])
 
+    coordinator = DataUpdateCoordinator(
+        hass,
+        _LOGGER,
+        name=DOMAIN,
+        update_interval=MIN_TIME_BETWEEN_UPDATES,
+        update_method=controller.get_grouped_unpaid_invoices
+    )
+    await coordinator.async_config_entry_first_refresh()
+
+    entry_id = config_entry.entry_id
+    entities = []
     for registered_invoice_issuer in await controller.get_issuers():
-        async_add_entities(
-            [InvoiceAmountSensor(controller, config_entry.entry_id, registered_invoice_issuer, provider)
-             for provider in registered_invoice_issuer.providers]
+        unique_id_prefix = \
+            f'{entry_id}_{registered_invoice_issuer.issuer}_{registered_invoice_issuer.issuer_id}'
+        entities.extend(
+            InvoiceAmountSensor(coordinator, unique_id_prefix, registered_invoice_issuer, provider)
+            for provider in registered_invoice_issuer.providers
         )
-        _LOGGER.debug('Sensor added (%s)', registered_invoice_issuer)
+    async_add_entities(entities)
 
     _LOGGER.info('Setting up Dijnet sensors completed.')
     return True
 
 
-class InvoiceAmountSensor(SensorEntity):
+class InvoiceAmountSensor(CoordinatorEntity, SensorEntity):
     def __init__(
         self,
-        controller: DijnetController,
-        config_entry_id: str,
+        coordinator: DataUpdateCoordinator,
+        unique_id_prefix: str,
         invoice_issuer: InvoiceIssuer,
         provider: str,
     ):
-        self._controller = controller
+        super().__init__(coordinator)
         self._invoice_issuer = invoice_issuer
-        self._state = None
-        self._attr_unique_id = f'{config_entry_id}_{invoice_issuer.issuer}_{invoice_issuer.issuer_id}_{provider}_amount'
+        self._attr_unique_id = f'{unique_id_prefix}_{provider}_amount'
         self._provider = provider
+        self._invoices_key = (invoice_issuer.display_name, provider)
+        self._attributes_cache_key: Optional[Tuple[str, ...]] = None
+        self._attributes: Dict[str, Any] = {}
+        self._attr_device_info = DeviceInfo(
+            entry_type=DeviceEntryType.SERVICE,
+            configuration_url='https://dijnet.hu/',
+            manufacturer='Dijnet Zrt',
+            identifiers={(DOMAIN, f'{invoice_issuer.issuer}|{invoice_issuer.issuer_id}')},
+            name=invoice_issuer.display_name
+        )
         self.entity_description = SensorEntityDescription(
             key='invoice_amount',
             device_class=SensorDeviceClass.MONETARY,
@@ -106,20 +132,22 @@ class InvoiceAmountSensor(SensorEntity):
             name=f'Dijnet - {provider} fizetendő összeg'
         )
 
+    def _get_invoices(self) -> List[Invoice]:
+        return self.coordinator.data.get(self._invoices_key, [])
+
     @property
-    def device_info(self) -> DeviceInfo:
-        return DeviceInfo(
-            entry_type=DeviceEntryType.SERVICE,
-            configuration_url='https://dijnet.hu/',
-            manufacturer='Dijnet Zrt',
-            identifiers={(DOMAIN, self._invoice_issuer.issuer +
-                          '|' + self._invoice_issuer.issuer_id)},
-            name=self._invoice_issuer.display_name
-        )
+    def native_value(self) -> int:
+        return sum(invoice.amount for invoice in self._get_invoices())
 
-    async def async_update(self):
-        invoices = [invoice for invoice in await self._controller.get_unpaid_invoices() if invoice.display_name == self._invoice_issuer.display_name and invoice.provider == self._provider]
-        self._attr_native_value = sum([invoice.amount for invoice in invoices])
-        self._attr_extra_state_attributes = {
-            'unpaid_invoices': [invoice.to_dictionary() for invoice in invoices]
-        }
+    @property
+    def extra_state_attributes(self) -> Dict[str, Any]:
+        # the invoice dictionaries are rebuilt only when the underlying
+        # invoice set changes, not on every state read
+        invoices = self._get_invoices()
+        cache_key = tuple(invoice.invoice_no for invoice in invoices)
+        if cache_key != self._attributes_cache_key:
+            self._attributes_cache_key = cache_key
+            self._attributes = {
+                'unpaid_invoices': [invoice.to_dictionary() for invoice in invoices]
+            }
+        return self._attributes